@@ -8,8 +8,11 @@ supporting real-time webcam detection, image upload, and video processing.
 import os
 import sys
 import time
+import json
 import base64
 import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from typing import Optional
 
@@ -24,8 +27,35 @@ from fastapi.middleware.cors import CORSMiddleware
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from utils.detector import FaceDetector
+from detection import (
+    AcceleratedDetector, faces_to_json, frame_hash, hash_distance,
+    has_motion, motion_thumbnail, to_gray
+)
 import config
 
+# Optional libjpeg-turbo bindings for faster JPEG encode/decode
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    _tj = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    _tj = None
+
+# Worker processes serving the app. Only the launchers (run.sh and __main__
+# below) know the real count and export it as WEB_WORKERS; any other launch
+# (plain uvicorn, --reload, TestClient) is a single process.
+WORKER_COUNT = int(os.environ.get("WEB_WORKERS") or 1)
+
+# CPU cores available to this worker process
+CORES_PER_WORKER = max(1, (os.cpu_count() or 1) // WORKER_COUNT)
+
+# Use optimized OpenCV kernels. With several workers each one stays
+# single-threaded; a lone worker keeps a core free for its event loop.
+cv2.setUseOptimized(True)
+cv2.setNumThreads(
+    config.OPENCV_THREADS
+    or (1 if WORKER_COUNT > 1 else max(1, CORES_PER_WORKER - 1))
+)
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Face Detection System",
@@ -47,8 +77,124 @@ static_dir = os.path.join(os.path.dirname(__file__), "static")
 os.makedirs(static_dir, exist_ok=True)
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
-# Global detector instance
-detector = FaceDetector()
+# Thread pool running blocking OpenCV work (decode, detect, encode) off the
+# event loop. OpenCV releases the GIL, so concurrent requests use separate
+# cores; the pool is sized to this worker's share of the CPU.
+EXECUTOR = ThreadPoolExecutor(max_workers=CORES_PER_WORKER)
+
+# Chunk size for streaming uploaded files into memory
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Per-process detector instance, created lazily by get_detector()
+_accel: Optional[AcceleratedDetector] = None
+_accel_pid: Optional[int] = None
+
+
+def get_detector() -> AcceleratedDetector:
+    """
+    Return this process's detector, loading the cascade on first use.
+    
+    Each uvicorn worker gets its own instance; the PID check also makes
+    a detector inherited through fork reload in the child process.
+    
+    Returns:
+        AcceleratedDetector wrapping the process's FaceDetector
+    """
+    global _accel, _accel_pid
+    
+    if _accel is None or _accel_pid != os.getpid():
+        _accel = AcceleratedDetector(FaceDetector())
+        _accel_pid = os.getpid()
+    
+    return _accel
+
+
+def decode_image(
+    data: bytes,
+    exif_free: bool = False,
+    dst: Optional[np.ndarray] = None
+) -> Optional[np.ndarray]:
+    """
+    Decode encoded image bytes into a BGR array.
+    
+    OpenCV applies the EXIF orientation of photos; TurboJPEG does not.
+    TurboJPEG is therefore only used for frames known to carry no EXIF
+    orientation, such as JPEGs produced by a browser canvas, and OpenCV
+    remains the decoder for non-JPEG input or when TurboJPEG is not
+    installed.
+    
+    Args:
+        data: Encoded image bytes
+        exif_free: The data has no EXIF orientation, so the TurboJPEG
+            fast path can be used
+        dst: Preallocated uint8 BGR buffer for the TurboJPEG path; reused
+            when its shape matches the image, replaced otherwise
+    
+    Returns:
+        Decoded BGR image, or None if decoding failed
+    """
+    if exif_free and _tj is not None:
+        try:
+            width, height = _tj.decode_header(data)[:2]
+            if dst is None or dst.shape != (height, width, 3):
+                dst = np.empty((height, width, 3), dtype=np.uint8)
+            return _tj.decode(data, pixel_format=TJPF_BGR, dst=dst)
+        except (OSError, ValueError):
+            pass
+    nparr = np.frombuffer(data, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+
+def encode_jpeg(image: np.ndarray, quality: int = 90) -> bytes:
+    """
+    Encode a BGR image as JPEG.
+    
+    Args:
+        image: BGR image
+        quality: JPEG quality (0-100)
+    
+    Returns:
+        JPEG bytes
+    """
+    if _tj is not None:
+        return _tj.encode(image, quality=quality, pixel_format=TJPF_BGR)
+    _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes()
+
+
+async def read_upload(file: UploadFile) -> bytearray:
+    """
+    Read an uploaded file in chunks into a single buffer.
+    
+    The buffer is sized up front when the upload size is known, so large
+    files are not held twice in memory while being read.
+    
+    Args:
+        file: Uploaded file
+    
+    Returns:
+        File contents
+    """
+    buffer = bytearray(file.size or 0)
+    offset = 0
+    
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer[offset:offset + len(chunk)] = chunk
+        offset += len(chunk)
+    
+    # Trim in case the declared size was larger than the data
+    del buffer[offset:]
+    return buffer
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking OpenCV call on the shared thread pool."""
+    return await asyncio.get_running_loop().run_in_executor(
+        EXECUTOR, functools.partial(func, *args, **kwargs)
+    )
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -64,7 +210,12 @@ async def root():
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint."""
-    return {"status": "healthy", "detector_loaded": detector.cascade is not None}
+    accel = get_detector()
+    return {
+        "status": "healthy",
+        "detector_loaded": accel.detector.cascade is not None,
+        "backend": accel.backend
+    }
 
 
 @app.post("/api/detect/image")
@@ -84,11 +235,12 @@ async def detect_image(
     Returns:
         JSON with detected faces and processed image
     """
+    accel = get_detector()
+    
     try:
         # Read image
-        contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        contents = await read_upload(file)
+        image = await run_blocking(decode_image, contents)
         
         if image is None:
             return JSONResponse(
@@ -96,26 +248,22 @@ async def detect_image(
                 content={"error": "Could not decode image"}
             )
         
-        # Update detector parameters
-        detector.set_detection_params(
-            scale_factor=scale_factor,
-            min_neighbors=min_neighbors
-        )
-        
         # Detect faces
         start_time = time.time()
-        processed_image, faces = detector.process_frame(image)
+        processed_image, faces = await run_blocking(
+            accel.process_frame, image,
+            scale_factor=scale_factor, min_neighbors=min_neighbors
+        )
         detection_time = (time.time() - start_time) * 1000  # Convert to ms
         
         # Convert processed image to base64
-        _, buffer = cv2.imencode('.jpg', processed_image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        buffer = await run_blocking(encode_jpeg, processed_image, 90)
         img_base64 = base64.b64encode(buffer).decode('utf-8')
         
         return {
             "success": True,
             "faces_count": len(faces),
-            "faces": [{"x": int(x), "y": int(y), "width": int(w), "height": int(h)} 
-                      for x, y, w, h in faces],
+            "faces": faces_to_json(faces),
             "detection_time_ms": round(detection_time, 2),
             "image_data": f"data:image/jpeg;base64,{img_base64}",
             "original_size": {"width": image.shape[1], "height": image.shape[0]}
@@ -128,7 +276,60 @@ async def detect_image(
         )
 
 
-@app.post("/api/detect/base64")
+@app.post("/api/rects")
+async def detect_rects(
+    file: UploadFile = File(...),
+    scale_factor: float = Form(1.1),
+    min_neighbors: int = Form(5)
+):
+    """
+    Detect faces in an uploaded frame and return only the rectangles.
+    Used for video frame processing, where the client already has the
+    frame and only needs the boxes to draw.
+    
+    Args:
+        file: Encoded image (JPEG, PNG, ...)
+        scale_factor: Detection scale factor
+        min_neighbors: Minimum neighbors threshold
+    
+    Returns:
+        JSON with detected faces
+    """
+    accel = get_detector()
+    
+    try:
+        # Frames come from the client's canvas, which writes no EXIF
+        image = await run_blocking(decode_image, await read_upload(file), exif_free=True)
+        
+        if image is None:
+            return JSONResponse(
+                status_code=400,
+                content={"error": "Could not decode image"}
+            )
+        
+        # Detect faces
+        start_time = time.time()
+        faces = await run_blocking(
+            accel.detect_faces, image,
+            scale_factor=scale_factor, min_neighbors=min_neighbors, streaming=True
+        )
+        detection_time = (time.time() - start_time) * 1000
+        
+        return {
+            "success": True,
+            "faces_count": len(faces),
+            "faces": faces_to_json(faces),
+            "detection_time_ms": round(detection_time, 2)
+        }
+        
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": str(e)}
+        )
+
+
+@app.post("/api/detect/base64", deprecated=True)
 async def detect_base64(
     image_data: str = Form(...),
     scale_factor: float = Form(1.1),
@@ -136,16 +337,21 @@ async def detect_base64(
 ):
     """
     Process a base64 encoded image for face detection.
-    Used for webcam frame processing.
+    
+    Deprecated: use /api/rects, which takes the encoded image as a file
+    upload and avoids the base64 round-trip.
     """
+    print("[WARNING] /api/detect/base64 is deprecated, use /api/rects")
+    
+    accel = get_detector()
+    
     try:
         # Decode base64 image
         if "," in image_data:
             image_data = image_data.split(",")[1]
         
         img_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        image = await run_blocking(decode_image, img_bytes)
         
         if image is None:
             return JSONResponse(
@@ -153,22 +359,18 @@ async def detect_base64(
                 content={"error": "Could not decode image"}
             )
         
-        # Update detector parameters
-        detector.set_detection_params(
-            scale_factor=scale_factor,
-            min_neighbors=min_neighbors
-        )
-        
         # Detect faces
         start_time = time.time()
-        faces = detector.detect_faces(image)
+        faces = await run_blocking(
+            accel.detect_faces, image,
+            scale_factor=scale_factor, min_neighbors=min_neighbors
+        )
         detection_time = (time.time() - start_time) * 1000
         
         return {
             "success": True,
             "faces_count": len(faces),
-            "faces": [{"x": int(x), "y": int(y), "width": int(w), "height": int(h)} 
-                      for x, y, w, h in faces],
+            "faces": faces_to_json(faces),
             "detection_time_ms": round(detection_time, 2)
         }
         
@@ -183,7 +385,17 @@ async def detect_base64(
 async def websocket_detect(websocket: WebSocket):
     """
     WebSocket endpoint for real-time face detection.
-    Receives base64 frames and returns detection results.
+    Receives encoded frames as binary messages and returns detection results.
+    Text messages carry JSON parameter updates ("scale_factor",
+    "min_neighbors"); a base64 "frame" field is still accepted for
+    older clients.
+    
+    Frames are received and detected on separate tasks connected by a
+    bounded queue; when detection falls behind, the oldest pending frame
+    is dropped so results always track the latest frame. Frames that are
+    perceptually unchanged and show no motion since the last detection
+    reuse its faces and are flagged with "cached". If detection fails,
+    the socket is closed right away with code 1011.
     """
     await websocket.accept()
     
@@ -191,52 +403,136 @@ async def websocket_detect(websocket: WebSocket):
     scale_factor = 1.1
     min_neighbors = 5
     
-    try:
+    accel = get_detector()
+    
+    # GPU buffers reused across this client's frames
+    gpu_context = accel.new_context()
+    
+    frames = asyncio.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+    
+    async def detect_frames():
+        """Consume queued frames, run detection and send the results."""
+        # Hash, motion thumbnail, parameters and faces of the last detected frame
+        prev_hash = None
+        prev_thumb = None
+        prev_params = None
+        prev_faces = []
+        
+        # BGR and grayscale buffers reused across frames of the same size
+        bgr_buf = None
+        gray_buf = None
+        
         while True:
-            # Receive message
-            data = await websocket.receive_json()
+            frame_data, frame_scale_factor, frame_min_neighbors = await frames.get()
             
-            # Check for parameter updates
-            if "scale_factor" in data:
-                scale_factor = float(data["scale_factor"])
-            if "min_neighbors" in data:
-                min_neighbors = int(data["min_neighbors"])
-            
-            # Process frame if provided
-            if "frame" in data:
-                frame_data = data["frame"]
-                
-                # Decode base64 image
+            # Legacy clients send base64 data URLs
+            if isinstance(frame_data, str):
                 if "," in frame_data:
                     frame_data = frame_data.split(",")[1]
+                frame_data = base64.b64decode(frame_data)
+            
+            # Canvas frames carry no EXIF orientation
+            image = await run_blocking(decode_image, frame_data, exif_free=True, dst=bgr_buf)
+            
+            if image is None:
+                continue
+            bgr_buf = image
+            
+            start_time = time.time()
+            
+            # Convert once; shared by the hash and the cascade
+            gray = to_gray(image, gray_buf)
+            gray_buf = gray
+            
+            # Reuse the last detection if the frame is unchanged
+            params = (frame_scale_factor, frame_min_neighbors)
+            current_hash = frame_hash(gray)
+            current_thumb = motion_thumbnail(gray) if config.MOTION_GATED else None
+            
+            cached = (
+                (config.HASH_CACHE_DISTANCE is not None or config.MOTION_GATED)
+                and prev_params is not None
+                and params == prev_params
+            )
+            if cached and config.HASH_CACHE_DISTANCE is not None:
+                cached = hash_distance(prev_hash, current_hash) <= config.HASH_CACHE_DISTANCE
+            if cached and config.MOTION_GATED:
+                cached = not has_motion(prev_thumb, current_thumb)
+            
+            if cached:
+                faces = prev_faces
+            else:
+                faces = await run_blocking(
+                    accel.detect_faces, image, gpu_context, gray,
+                    scale_factor=frame_scale_factor,
+                    min_neighbors=frame_min_neighbors,
+                    streaming=True
+                )
+                prev_hash, prev_thumb = current_hash, current_thumb
+                prev_params, prev_faces = params, faces
+            
+            detection_time = (time.time() - start_time) * 1000
+            
+            # Send results
+            await websocket.send_json({
+                "faces_count": len(faces),
+                "faces": faces_to_json(faces),
+                "detection_time_ms": round(detection_time, 2),
+                "cached": cached
+            })
+    
+    detect_task = asyncio.create_task(detect_frames())
+    receive_task = None
+    
+    try:
+        while True:
+            # Receive the next message, but wake up as soon as detection
+            # fails so the client is not left waiting for results
+            receive_task = asyncio.ensure_future(websocket.receive())
+            await asyncio.wait(
+                {receive_task, detect_task}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if detect_task.done():
+                detect_task.result()
+            message = receive_task.result()
+            
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            
+            # Binary messages are raw encoded frames
+            frame = message.get("bytes")
+            
+            # Text messages are JSON control updates
+            if message.get("text") is not None:
+                data = json.loads(message["text"])
                 
-                img_bytes = base64.b64decode(frame_data)
-                nparr = np.frombuffer(img_bytes, np.uint8)
-                image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                
-                if image is not None:
-                    # Update and detect
-                    detector.set_detection_params(
-                        scale_factor=scale_factor,
-                        min_neighbors=min_neighbors
-                    )
-                    
-                    start_time = time.time()
-                    faces = detector.detect_faces(image)
-                    detection_time = (time.time() - start_time) * 1000
-                    
-                    # Send results
-                    await websocket.send_json({
-                        "faces_count": len(faces),
-                        "faces": [{"x": int(x), "y": int(y), "width": int(w), "height": int(h)} 
-                                  for x, y, w, h in faces],
-                        "detection_time_ms": round(detection_time, 2)
-                    })
+                if "scale_factor" in data:
+                    scale_factor = float(data["scale_factor"])
+                if "min_neighbors" in data:
+                    min_neighbors = int(data["min_neighbors"])
+                if "frame" in data:
+                    frame = data["frame"]
+            
+            # Queue frame if provided, dropping the stalest one when full
+            if frame is not None:
+                if frames.full():
+                    frames.get_nowait()
+                frames.put_nowait((frame, scale_factor, min_neighbors))
                     
     except WebSocketDisconnect:
         print("[INFO] WebSocket client disconnected")
     except Exception as e:
         print(f"[ERROR] WebSocket error: {e}")
+        try:
+            await websocket.close(code=1011)
+        except Exception:
+            pass  # Connection already closed
+    finally:
+        tasks = [task for task in (receive_task, detect_task) if task is not None]
+        for task in tasks:
+            task.cancel()
+        # Wait for both tasks to finish so their exceptions are retrieved
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
 @app.get("/api/config")
@@ -256,4 +552,13 @@ if __name__ == "__main__":
     print("  FACE DETECTION WEB INTERFACE")
     print("  Open http://localhost:8000 in your browser")
     print("="*60 + "\n")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Spawned workers inherit the count through the environment
+    workers = int(os.environ.get("WEB_WORKERS") or config.WEB_WORKERS or os.cpu_count() or 1)
+    os.environ["WEB_WORKERS"] = str(workers)
+    uvicorn.run(
+        "app:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=workers,
+        app_dir=os.path.dirname(os.path.abspath(__file__))
+    )
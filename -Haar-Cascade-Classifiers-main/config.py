@@ -25,6 +25,10 @@ MIN_NEIGHBORS = 5
 # Objects smaller than this are ignored.
 MIN_SIZE = (30, 30)
 
+# Histogram Equalization: Normalize contrast of the grayscale frame once
+# before detection. Improves detection under uneven lighting.
+EQUALIZE_HISTOGRAM = True
+
 # Maximum Size: Maximum possible object size (width, height in pixels).
 # Objects larger than this are ignored. None = no limit.
 MAX_SIZE = None
@@ -62,6 +66,13 @@ CASCADE_PATH = "models/haarcascade_frontalface_default.xml"
 # - haarcascade_profileface.xml (side profile detection)
 # - haarcascade_eye.xml (eye detection)
 
+# Cascade used by the CUDA backend. cv2.cuda_CascadeClassifier only reads
+# old-format Haar files or new-format LBP files, not the new-format Haar
+# file above. Copy the matching file from OpenCV's data/haarcascades_cuda
+# directory here (it is not included in the pip wheels); without it the
+# CPU cascade is used.
+CUDA_CASCADE_PATH = "models/haarcascades_cuda/haarcascade_frontalface_default.xml"
+
 # =============================================================================
 # PERFORMANCE SETTINGS
 # =============================================================================
@@ -73,6 +84,62 @@ TARGET_FPS = 30
 # Lower values = faster processing but less accurate
 RESIZE_FACTOR = 1.0
 
+# Longest side (in pixels) of streaming frames (webcam, video, websocket)
+# fed to the cascade. Larger frames are converted to grayscale, downscaled
+# (INTER_AREA) before detection and the rectangles are mapped back. The
+# 24 px cascade window then limits the smallest detectable face to about
+# 24 * long_edge / 320 px: 48 px at 640 px wide, 144 px at 1920 px.
+# Still images are not capped, and are never downscaled so far that faces
+# of MIN_SIZE become undetectable.
+# None = no cap
+DETECT_LONG_EDGE = 320
+
+# Run the CPU cascade through OpenCL (cv2.UMat) when an OpenCL device,
+# such as an integrated GPU, is available. Ignored when CUDA is used.
+USE_OPENCL = True
+
+# Number of threads OpenCV uses for parallel detection in each web server
+# worker. Every worker also runs a detection thread pool sized to
+# cpu_count // WEB_WORKERS, so the total stays close to the core count.
+# None = 1 thread when there are several workers (parallelism comes from
+# the processes), or all cores but one with a single worker, leaving a
+# core for its event loop
+OPENCV_THREADS = None
+
+# Maximum number of frames buffered between pipeline stages
+# (capture -> detect -> display). Small values bound memory and latency.
+PIPELINE_QUEUE_SIZE = 2
+
+# Maximum perceptual-hash distance (0-64 bits) at which a webcam frame is
+# considered unchanged and the previous detections are reused.
+# None = always run detection
+HASH_CACHE_DISTANCE = 4
+
+# Motion gating: skip detection and reuse the previous faces when a frame
+# barely differs from the last detected one (webcam and video streams).
+MOTION_GATED = True
+
+# Size (width, height) of the thumbnails compared for motion
+MOTION_SIZE = (160, 120)
+
+# Minimum per-pixel intensity change counted as motion
+MOTION_PIXEL_THRESHOLD = 15
+
+# Minimum number of changed thumbnail pixels that triggers a new detection
+MOTION_MIN_PIXELS = 500
+
+# =============================================================================
+# WEB SERVER SETTINGS
+# =============================================================================
+
+# Number of uvicorn worker processes started by `python app.py`.
+# Each worker loads its own detector and gets cpu_count // WEB_WORKERS
+# cores for its thread pool (see OPENCV_THREADS). The WEB_WORKERS
+# environment variable overrides this value, and run.sh sets it from
+# WORKERS instead. Other launches (e.g. `uvicorn app:app`) always run a
+# single worker that uses every core. None = one worker per CPU core
+WEB_WORKERS = None
+
 # =============================================================================
 # OUTPUT SETTINGS
 # =============================================================================
@@ -85,3 +152,7 @@ OUTPUT_IMAGE_FORMAT = ".jpg"
 
 # JPEG quality (0-100)
 JPEG_QUALITY = 95
+
+# ffmpeg encoders tried, in order, for saved videos. The first one ffmpeg
+# supports is used; without ffmpeg, OpenCV's XVID writer is the fallback.
+FFMPEG_CODECS = ["h264_nvenc", "h264_qsv", "h264_videotoolbox", "libx264"]
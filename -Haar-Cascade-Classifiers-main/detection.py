@@ -0,0 +1,595 @@
+"""
+Accelerated detection backends for the Face Detection System.
+
+This module wraps a FaceDetector and routes detection to the fastest
+backend available on the current machine, falling back to the CPU
+Haar cascade when no accelerator is present. The scale factor and
+minimum neighbors can be passed per call and default to the wrapped
+detector's values; the minimum face size always comes from the detector.
+"""
+
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import config
+
+# (scale_factor, min_neighbors, min_size) passed to a cascade
+CascadeParams = Tuple[float, int, Tuple[int, int]]
+
+# Training window size (pixels) of the frontal-face Haar cascades; the
+# smallest face found in a downscaled image is this size over the scale
+CASCADE_WINDOW = 24
+
+
+def cuda_available() -> bool:
+    """
+    Check whether OpenCV was built with CUDA and a device is present.
+
+    Returns:
+        True if at least one CUDA device can be used
+    """
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
+
+def opencl_available() -> bool:
+    """
+    Check whether OpenCV can use an OpenCL device (T-API).
+
+    Returns:
+        True if an OpenCL device is available
+    """
+    try:
+        return cv2.ocl.haveOpenCL()
+    except (AttributeError, cv2.error):
+        return False
+
+
+def resolve_cascade_path(detector=None) -> str:
+    """
+    Find the cascade XML file to load additional classifiers from.
+
+    Tries, in order: the path the detector loaded its cascade from (if it
+    records one), config.CASCADE_PATH relative to the working directory,
+    the same path relative to the project directory, and the copy shipped
+    with OpenCV in cv2.data.haarcascades.
+
+    Args:
+        detector: FaceDetector whose cascade file should be reused
+
+    Returns:
+        Path to the cascade XML file
+
+    Raises:
+        FileNotFoundError: If no candidate file exists
+    """
+    candidates = [
+        getattr(detector, "cascade_path", None),
+        config.CASCADE_PATH,
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), config.CASCADE_PATH),
+    ]
+    haarcascades = getattr(getattr(cv2, "data", None), "haarcascades", None)
+    if haarcascades:
+        candidates.append(os.path.join(haarcascades, os.path.basename(config.CASCADE_PATH)))
+
+    for path in candidates:
+        if path and os.path.isfile(path):
+            return path
+
+    raise FileNotFoundError(
+        f"Cascade file not found; tried: {', '.join(p for p in candidates if p)}"
+    )
+
+
+def resolve_cuda_cascade_path() -> str:
+    """
+    Find the cascade XML file for the CUDA backend.
+
+    Tries config.CUDA_CASCADE_PATH relative to the working directory, then
+    relative to the project directory. The CPU cascade file is never used:
+    it is a new-format Haar file, which cv2.cuda_CascadeClassifier rejects.
+
+    Returns:
+        Path to the CUDA cascade XML file
+
+    Raises:
+        FileNotFoundError: If no candidate file exists
+    """
+    candidates = [
+        config.CUDA_CASCADE_PATH,
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), config.CUDA_CASCADE_PATH),
+    ]
+
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+
+    raise FileNotFoundError(
+        f"CUDA cascade file not found; tried: {', '.join(candidates)}"
+    )
+
+
+def detection_scale(
+    shape: Tuple[int, int],
+    min_size: Tuple[int, int],
+    streaming: bool = False
+) -> float:
+    """
+    Compute the downscale factor applied before detection.
+
+    Streaming frames use config.RESIZE_FACTOR and the config.DETECT_LONG_EDGE
+    cap, trading small faces for frame rate. Still images ignore the cap and
+    are never shrunk so far that a face of min_size falls below the cascade
+    window, so small faces in large photos are still found.
+
+    Args:
+        shape: Image (height, width)
+        min_size: Smallest face size to detect, in original pixels
+        streaming: Whether the image is a webcam/video/websocket frame
+
+    Returns:
+        Scale factor in (0, 1]
+    """
+    scale = min(1.0, config.RESIZE_FACTOR)
+    if streaming:
+        if config.DETECT_LONG_EDGE:
+            scale = min(scale, config.DETECT_LONG_EDGE / max(shape))
+    else:
+        scale = max(scale, min(1.0, CASCADE_WINDOW / max(1, min(min_size))))
+    return scale
+
+
+def to_gray(image: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Convert an image to single-channel grayscale.
+
+    Args:
+        image: Input image (BGR or grayscale)
+        dst: Preallocated uint8 buffer to write into; reused when its
+            shape matches the image, ignored otherwise
+
+    Returns:
+        Grayscale image (the input itself if already single-channel)
+    """
+    if image.ndim == 2:
+        return image
+    if dst is not None and dst.shape == image.shape[:2]:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=dst)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def frame_hash(image: np.ndarray) -> int:
+    """
+    Compute a 64-bit difference hash (dHash) of an image.
+
+    Near-identical frames produce hashes within a small Hamming distance,
+    which lets callers reuse detections for static scenes.
+
+    Args:
+        image: Input image (BGR or grayscale)
+
+    Returns:
+        64-bit perceptual hash
+    """
+    small = cv2.resize(to_gray(image), (9, 8), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+def hash_distance(hash_a: int, hash_b: int) -> int:
+    """Number of differing bits between two frame hashes."""
+    return bin(hash_a ^ hash_b).count("1")
+
+
+def motion_thumbnail(gray: np.ndarray) -> np.ndarray:
+    """
+    Downsample a grayscale frame for cheap motion comparison.
+
+    Args:
+        gray: Grayscale frame
+
+    Returns:
+        Thumbnail of size config.MOTION_SIZE
+    """
+    return cv2.resize(gray, config.MOTION_SIZE, interpolation=cv2.INTER_AREA)
+
+
+def has_motion(reference: Optional[np.ndarray], thumbnail: np.ndarray) -> bool:
+    """
+    Check whether a frame differs enough from a reference to re-run detection.
+
+    Args:
+        reference: Thumbnail of the last detected frame (None = always motion)
+        thumbnail: Thumbnail of the current frame
+
+    Returns:
+        True if more than config.MOTION_MIN_PIXELS pixels changed by more
+        than config.MOTION_PIXEL_THRESHOLD
+    """
+    if reference is None or reference.shape != thumbnail.shape:
+        return True
+    _, changed = cv2.threshold(
+        cv2.absdiff(reference, thumbnail), config.MOTION_PIXEL_THRESHOLD, 255, cv2.THRESH_BINARY
+    )
+    return cv2.countNonZero(changed) > config.MOTION_MIN_PIXELS
+
+
+def faces_to_json(faces) -> List[dict]:
+    """
+    Convert face rectangles to JSON-serializable dictionaries.
+
+    Args:
+        faces: Sequence or array of (x, y, width, height)
+
+    Returns:
+        List of {"x", "y", "width", "height"} dictionaries
+    """
+    rects = np.asarray(faces, dtype=np.int32).reshape(-1, 4).tolist()
+    return [{"x": x, "y": y, "width": w, "height": h} for x, y, w, h in rects]
+
+
+def draw_faces(frame: np.ndarray, faces) -> np.ndarray:
+    """
+    Draw all face bounding boxes with a single OpenCV call.
+
+    Args:
+        frame: BGR frame to draw on (modified in place)
+        faces: Sequence or array of (x, y, width, height)
+
+    Returns:
+        The frame with boxes drawn
+    """
+    rects = np.asarray(faces, dtype=np.int32).reshape(-1, 4)
+    if len(rects):
+        x, y, w, h = rects.T
+        corners = np.stack(
+            [x, y, x + w, y, x + w, y + h, x, y + h], axis=1
+        ).reshape(-1, 4, 1, 2)
+        cv2.polylines(frame, list(corners), True, config.BOX_COLOR, config.BOX_THICKNESS)
+    return frame
+
+
+def draw_all(
+    frame: np.ndarray,
+    faces,
+    fps: float,
+    progress: Optional[float] = None
+) -> np.ndarray:
+    """
+    Draw every overlay (boxes, info text, progress bar) in one pass.
+
+    Args:
+        frame: BGR frame to draw on (modified in place)
+        faces: Sequence or array of (x, y, width, height)
+        fps: Current processing FPS
+        progress: Playback progress, clamped to [0, 1]; None for no bar
+
+    Returns:
+        The frame with overlays drawn
+    """
+    draw_faces(frame, faces)
+
+    cv2.putText(
+        frame, f"FPS: {fps:.1f} | Faces: {len(faces)}", config.FPS_POSITION,
+        cv2.FONT_HERSHEY_SIMPLEX, config.FONT_SCALE, config.FPS_COLOR, 2
+    )
+
+    if progress is not None:
+        progress = min(max(progress, 0.0), 1.0)
+        height, width = frame.shape[:2]
+        top = max(0, height - 20)
+        bottom = max(top, height - 10)
+        bar_start = int(width * 0.1)
+        bar_width = int(width * 0.8)
+        frame[top:bottom, bar_start:bar_start + bar_width] = (100, 100, 100)
+        frame[top:bottom, bar_start:bar_start + int(bar_width * progress)] = (0, 255, 0)
+
+    return frame
+
+
+def open_gpu_video(video_path: str):
+    """
+    Open a video for hardware (NVDEC) decoding into GPU memory.
+
+    Args:
+        video_path: Path to the video file
+
+    Returns:
+        A cv2.cudacodec.VideoReader, or None if GPU decoding is unavailable
+    """
+    try:
+        return cv2.cudacodec.createVideoReader(video_path)
+    except (AttributeError, cv2.error):
+        return None
+
+
+class CudaContext:
+    """
+    Per-client GPU resources for the CUDA backend.
+
+    Holds a preallocated GpuMat and a CUDA stream so consecutive frames
+    from the same client reuse device memory and upload asynchronously.
+    """
+
+    def __init__(self):
+        self.gpu_mat = cv2.cuda_GpuMat()
+        self.stream = cv2.cuda.Stream()
+
+
+class AcceleratedDetector:
+    """
+    Hardware-aware front end for a FaceDetector.
+
+    Uses cv2.cuda_CascadeClassifier when a CUDA device is available and
+    config.CUDA_CASCADE_PATH can be loaded, otherwise the CPU cascade, routed through OpenCL (cv2.UMat) when an
+    OpenCL device is present. CPU cascades are kept per thread, so the
+    same instance can serve detections from a thread pool.
+    """
+
+    def __init__(
+        self,
+        detector,
+        use_cuda: Optional[bool] = None,
+        use_opencl: Optional[bool] = None
+    ):
+        """
+        Initialize the accelerated detector.
+
+        Args:
+            detector: FaceDetector providing the parameters and cascade file
+            use_cuda: Force the CUDA backend on/off (default: auto-detect)
+            use_opencl: Force the OpenCL backend on/off
+                (default: config.USE_OPENCL and auto-detect)
+        """
+        self.detector = detector
+        self.cascade_path = resolve_cascade_path(detector)
+        self.cuda_cascade = None
+        self.use_opencl = False
+        self._local = threading.local()
+
+        # The CUDA cascade holds its parameters as state, so parameter
+        # updates and detection on it must not interleave across threads
+        self._cuda_lock = threading.Lock()
+        self._cuda_params: Optional[CascadeParams] = None
+
+        if use_cuda is None:
+            use_cuda = cuda_available()
+
+        if use_cuda:
+            try:
+                cuda_cascade_path = resolve_cuda_cascade_path()
+                self.cuda_cascade = cv2.cuda_CascadeClassifier.create(cuda_cascade_path)
+                print(f"[INFO] CUDA backend enabled ({cuda_cascade_path})")
+            except FileNotFoundError as e:
+                print(f"[WARNING] CUDA device found but no old-format Haar cascade "
+                      f"for it, using CPU: {e}")
+            except cv2.error as e:
+                print(f"[WARNING] CUDA cascade could not be loaded (it must be an "
+                      f"old-format Haar or an LBP file, see config.CUDA_CASCADE_PATH), "
+                      f"using CPU: {e}")
+
+        # OpenCL only applies to the CPU cascade path
+        if use_opencl is None:
+            use_opencl = config.USE_OPENCL and opencl_available()
+
+        if use_opencl and self.cuda_cascade is None:
+            cv2.ocl.setUseOpenCL(True)
+            self.use_opencl = cv2.ocl.useOpenCL()
+            if self.use_opencl:
+                print("[INFO] OpenCL backend enabled")
+
+    @property
+    def backend(self) -> str:
+        """Name of the active detection backend."""
+        if self.cuda_cascade is not None:
+            return "cuda"
+        return "opencl" if self.use_opencl else "cpu"
+
+    def new_context(self) -> Optional[CudaContext]:
+        """
+        Create per-client GPU resources.
+
+        Returns:
+            A CudaContext, or None when the CUDA backend is not active
+        """
+        return CudaContext() if self.cuda_cascade is not None else None
+
+    def detect_faces(
+        self,
+        image: np.ndarray,
+        context: Optional[CudaContext] = None,
+        gray: Optional[np.ndarray] = None,
+        scale_factor: Optional[float] = None,
+        min_neighbors: Optional[int] = None,
+        streaming: bool = False
+    ) -> List[Tuple[int, int, int, int]]:
+        """
+        Detect faces in an image.
+
+        Args:
+            image: Input image (BGR or grayscale)
+            context: Reusable GPU resources (CUDA backend only)
+            gray: Precomputed grayscale version of image, to avoid
+                converting the same frame more than once
+            scale_factor: Per-call scale factor (default: the detector's)
+            min_neighbors: Per-call minimum neighbors (default: the detector's)
+            streaming: Apply the streaming long-edge cap (see detection_scale)
+
+        Returns:
+            List of face rectangles as (x, y, width, height), in the
+            coordinates of the input image
+        """
+        if gray is None:
+            gray = to_gray(image)
+
+        scale = detection_scale(gray.shape[:2], self.detector.min_size, streaming)
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        if config.EQUALIZE_HISTOGRAM:
+            gray = cv2.equalizeHist(gray)
+
+        params = self._cascade_params(scale, scale_factor, min_neighbors)
+
+        if self.cuda_cascade is None:
+            faces = self._detect_cpu(gray, params)
+        else:
+            faces = self._detect_cuda(gray, params, context or CudaContext())
+
+        return self._rescale_faces(faces, scale)
+
+    def detect_gpu_frame(
+        self,
+        gpu_frame,
+        context: CudaContext
+    ) -> Tuple[np.ndarray, List[Tuple[int, int, int, int]]]:
+        """
+        Detect faces in a frame already in GPU memory.
+
+        Color conversion, downscaling and equalization run on the device;
+        only the BGR frame is downloaded, for display and writing.
+
+        Args:
+            gpu_frame: Decoded BGR or BGRA cv2.cuda_GpuMat
+            context: Reusable GPU resources
+
+        Returns:
+            Tuple of (downloaded BGR frame, detected faces)
+        """
+        stream = context.stream
+        bgra = gpu_frame.channels() == 4
+
+        gray = cv2.cuda.cvtColor(
+            gpu_frame, cv2.COLOR_BGRA2GRAY if bgra else cv2.COLOR_BGR2GRAY, stream=stream
+        )
+
+        width, height = gray.size()
+        scale = detection_scale((height, width), self.detector.min_size, streaming=True)
+        if scale < 1.0:
+            gray = cv2.cuda.resize(
+                gray, (int(width * scale), int(height * scale)),
+                interpolation=cv2.INTER_AREA, stream=stream
+            )
+
+        if config.EQUALIZE_HISTOGRAM:
+            gray = cv2.cuda.equalizeHist(gray, stream=stream)
+
+        params = self._cascade_params(scale)
+        faces = self._rescale_faces(self._detect_cuda_device(gray, params, context), scale)
+
+        if bgra:
+            gpu_frame = cv2.cuda.cvtColor(gpu_frame, cv2.COLOR_BGRA2BGR, stream=stream)
+        frame = gpu_frame.download(stream=stream)
+        stream.waitForCompletion()
+
+        return frame, faces
+
+    def process_frame(
+        self,
+        frame: np.ndarray,
+        context: Optional[CudaContext] = None,
+        gray: Optional[np.ndarray] = None,
+        scale_factor: Optional[float] = None,
+        min_neighbors: Optional[int] = None,
+        streaming: bool = False
+    ) -> Tuple[np.ndarray, List[Tuple[int, int, int, int]]]:
+        """
+        Detect faces and draw bounding boxes on the frame.
+
+        Args:
+            frame: Input BGR frame
+            context: Reusable GPU resources (CUDA backend only)
+            gray: Precomputed grayscale version of frame
+            scale_factor: Per-call scale factor (default: the detector's)
+            min_neighbors: Per-call minimum neighbors (default: the detector's)
+            streaming: Apply the streaming long-edge cap (see detection_scale)
+
+        Returns:
+            Tuple of (processed frame, detected faces)
+        """
+        faces = self.detect_faces(
+            frame, context, gray, scale_factor, min_neighbors, streaming
+        )
+        return draw_faces(frame, faces), faces
+
+    def _cascade_params(
+        self,
+        scale: float,
+        scale_factor: Optional[float] = None,
+        min_neighbors: Optional[int] = None
+    ) -> CascadeParams:
+        """Resolve cascade parameters, scaling the minimum size with the image."""
+        return (
+            scale_factor if scale_factor is not None else self.detector.scale_factor,
+            min_neighbors if min_neighbors is not None else self.detector.min_neighbors,
+            tuple(max(1, int(v * scale)) for v in self.detector.min_size)
+        )
+
+    @staticmethod
+    def _rescale_faces(faces, scale: float) -> List[Tuple[int, int, int, int]]:
+        """Map rectangles from the downscaled image back to the original."""
+        if scale < 1.0:
+            faces = [tuple(int(round(v / scale)) for v in face) for face in faces]
+        return faces
+
+    def _thread_cascade(self) -> cv2.CascadeClassifier:
+        """Return the calling thread's CPU cascade, loading it on first use."""
+        cascade = getattr(self._local, "cascade", None)
+        if cascade is None:
+            cascade = cv2.CascadeClassifier(self.cascade_path)
+            if cascade.empty():
+                raise RuntimeError(f"Failed to load cascade: {self.cascade_path}")
+            self._local.cascade = cascade
+        return cascade
+
+    def _detect_cpu(
+        self,
+        gray: np.ndarray,
+        params: CascadeParams
+    ) -> List[Tuple[int, int, int, int]]:
+        """Run the multi-scale cascade on the CPU (or OpenCL device)."""
+        scale_factor, min_neighbors, min_size = params
+        faces = self._thread_cascade().detectMultiScale(
+            cv2.UMat(gray) if self.use_opencl else gray,
+            scaleFactor=scale_factor,
+            minNeighbors=min_neighbors,
+            minSize=min_size
+        )
+        return [tuple(int(v) for v in face) for face in faces]
+
+    def _detect_cuda(
+        self,
+        gray: np.ndarray,
+        params: CascadeParams,
+        context: CudaContext
+    ) -> List[Tuple[int, int, int, int]]:
+        """Upload a gray frame and run the multi-scale cascade on the GPU."""
+        context.gpu_mat.upload(gray, context.stream)
+        return self._detect_cuda_device(context.gpu_mat, params, context)
+
+    def _detect_cuda_device(
+        self,
+        gpu_gray,
+        params: CascadeParams,
+        context: CudaContext
+    ) -> List[Tuple[int, int, int, int]]:
+        """Run the multi-scale cascade on a gray frame in GPU memory."""
+        with self._cuda_lock:
+            # Only touch the cascade's parameters when they change
+            if params != self._cuda_params:
+                scale_factor, min_neighbors, min_size = params
+                self.cuda_cascade.setScaleFactor(scale_factor)
+                self.cuda_cascade.setMinNeighbors(min_neighbors)
+                self.cuda_cascade.setMinObjectSize(min_size)
+                self._cuda_params = params
+
+            objects = self.cuda_cascade.detectMultiScale(gpu_gray, stream=context.stream)
+            context.stream.waitForCompletion()
+
+            return [tuple(int(v) for v in rect) for rect in self.cuda_cascade.convert(objects)]
@@ -30,17 +30,139 @@ License: MIT
 import argparse
 import cv2
 import os
+import queue
+import shutil
+import subprocess
 import sys
+import threading
 import time
-from typing import Optional
+from typing import Callable, Optional
 
 # Add project root to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 import config
+from detection import (
+    AcceleratedDetector, draw_all, has_motion, motion_thumbnail, open_gpu_video, to_gray
+)
 from utils.detector import FaceDetector
 
 
+class FFmpegVideoWriter:
+    """
+    Video writer that pipes raw BGR frames to an ffmpeg process.
+    
+    Offers the write()/release() subset of cv2.VideoWriter so it can be
+    used in its place, while encoding with a hardware H.264 encoder when
+    ffmpeg provides one.
+    """
+    
+    # Result of select_codec(), probed once per process
+    _selected_codec: Optional[str] = None
+    _codec_probed = False
+    
+    def __init__(self, output_path: str, fps: float, frame_size: tuple, codec: str):
+        """
+        Start the ffmpeg encoder process.
+        
+        Args:
+            output_path: Output video path
+            fps: Frames per second
+            frame_size: Frame (width, height)
+            codec: ffmpeg video encoder name (e.g. h264_nvenc)
+        """
+        self.codec = codec
+        width, height = frame_size
+        self.process = subprocess.Popen(
+            [
+                "ffmpeg", "-y", "-loglevel", "error",
+                "-f", "rawvideo", "-pix_fmt", "bgr24",
+                "-s", f"{width}x{height}", "-r", str(fps),
+                "-i", "-",
+                "-c:v", codec, "-pix_fmt", "yuv420p",
+                output_path
+            ],
+            stdin=subprocess.PIPE
+        )
+    
+    @staticmethod
+    def _probe_codec(codec: str) -> bool:
+        """
+        Check that an encoder really works by encoding one test frame.
+        
+        ffmpeg lists hardware encoders it was built with even when the
+        hardware is missing, so listing alone is not enough.
+        
+        Args:
+            codec: ffmpeg video encoder name
+        
+        Returns:
+            True if the encoder produced a frame
+        """
+        try:
+            result = subprocess.run(
+                [
+                    "ffmpeg", "-hide_banner", "-loglevel", "error",
+                    "-f", "lavfi", "-i", "nullsrc=s=256x256",
+                    "-frames:v", "1", "-c:v", codec, "-pix_fmt", "yuv420p",
+                    "-f", "null", "-"
+                ],
+                capture_output=True, timeout=15
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return False
+        return result.returncode == 0
+    
+    @classmethod
+    def select_codec(cls) -> Optional[str]:
+        """
+        Pick the first encoder from config.FFMPEG_CODECS that works here.
+        
+        The result is cached for the lifetime of the process.
+        
+        Returns:
+            Encoder name, or None if ffmpeg or all encoders are unavailable
+        """
+        if not cls._codec_probed:
+            cls._codec_probed = True
+            if shutil.which("ffmpeg") is not None:
+                cls._selected_codec = next(
+                    (codec for codec in config.FFMPEG_CODECS if cls._probe_codec(codec)),
+                    None
+                )
+        return cls._selected_codec
+    
+    def _failure(self) -> str:
+        """Describe why the encoder process is no longer accepting frames."""
+        return f"ffmpeg encoder '{self.codec}' exited with code {self.process.returncode}"
+    
+    def write(self, frame) -> None:
+        """
+        Send one BGR frame to the encoder.
+        
+        Raises:
+            RuntimeError: If the ffmpeg process has exited
+        """
+        if self.process.poll() is not None:
+            raise RuntimeError(self._failure())
+        try:
+            self.process.stdin.write(frame.tobytes())
+        except BrokenPipeError:
+            self.process.wait()
+            raise RuntimeError(self._failure()) from None
+    
+    def release(self) -> None:
+        """Flush the encoder and wait for ffmpeg to finish. Never raises."""
+        if self.process.stdin.closed:
+            return
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        if self.process.wait() != 0:
+            print(f"[ERROR] {self._failure()}; output may be incomplete")
+
+
 class FaceDetectionApp:
     """
     Main application class for face detection.
@@ -68,6 +190,8 @@ class FaceDetectionApp:
             min_neighbors=min_neighbors,
             min_size=min_size
         )
+        self.accel = AcceleratedDetector(self.detector)
+        self.gpu_context = self.accel.new_context()
         
         # FPS calculation
         self.fps_start_time = time.time()
@@ -91,6 +215,135 @@ class FaceDetectionApp:
             
         return self.current_fps
     
+    @staticmethod
+    def _queue_put(q: queue.Queue, item, stop_event: threading.Event) -> bool:
+        """Put an item on a bounded queue, giving up once the pipeline stops."""
+        while not stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    @staticmethod
+    def _queue_get(q: queue.Queue, stop_event: threading.Event):
+        """Get an item from a queue, returning None once the pipeline stops."""
+        while not stop_event.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+    
+    def _start_pipeline(
+        self,
+        read_frame: Callable,
+        stop_event: threading.Event,
+        gpu_frames: bool = False
+    ):
+        """
+        Start the capture and detection stages on background threads.
+        
+        Frames flow capture -> detect -> caller through bounded queues, so
+        reading, detecting and displaying/encoding overlap instead of
+        running one after another.
+        
+        Args:
+            read_frame: Callable returning (ret, frame), e.g. cap.read
+            stop_event: Event that stops both stages when set
+            gpu_frames: Whether read_frame yields cv2.cuda_GpuMat frames
+        
+        Returns:
+            Tuple of (output queue, worker threads, errors). The queue
+            yields (frame, faces) and a final None when the source ends;
+            overlays are left to the caller. If a stage raises, the
+            exception is appended to errors, the pipeline is stopped and
+            the queue yields None; raise it with _raise_pipeline_error()
+            after _stop_pipeline().
+        """
+        capture_queue = queue.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+        output_queue = queue.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+        errors = []
+        
+        def fail(error: Exception) -> None:
+            # Record the error and wake the caller instead of leaving it
+            # blocked on a queue no stage will ever fill again
+            errors.append(error)
+            stop_event.set()
+            try:
+                output_queue.put_nowait(None)
+            except queue.Full:
+                pass
+        
+        def capture():
+            try:
+                while not stop_event.is_set():
+                    ret, frame = read_frame()
+                    if not self._queue_put(capture_queue, frame if ret else None, stop_event) or not ret:
+                        break
+            except Exception as e:
+                fail(e)
+        
+        def detect():
+            # Motion thumbnail and faces of the last detected frame
+            prev_thumb = None
+            prev_faces = []
+            
+            try:
+                while True:
+                    frame = self._queue_get(capture_queue, stop_event)
+                    if frame is None:
+                        self._queue_put(output_queue, None, stop_event)
+                        break
+                    if gpu_frames:
+                        result = self.accel.detect_gpu_frame(frame, self.gpu_context)
+                    elif config.MOTION_GATED:
+                        # Re-run detection only when the scene changed
+                        gray = to_gray(frame)
+                        thumb = motion_thumbnail(gray)
+                        if has_motion(prev_thumb, thumb):
+                            prev_faces = self.accel.detect_faces(
+                                frame, self.gpu_context, gray, streaming=True
+                            )
+                            prev_thumb = thumb
+                        result = (frame, prev_faces)
+                    else:
+                        result = (
+                            frame, self.accel.detect_faces(frame, self.gpu_context, streaming=True)
+                        )
+                    if not self._queue_put(output_queue, result, stop_event):
+                        break
+            except Exception as e:
+                fail(e)
+        
+        workers = [
+            threading.Thread(target=capture, name="capture", daemon=True),
+            threading.Thread(target=detect, name="detect", daemon=True)
+        ]
+        for worker in workers:
+            worker.start()
+        
+        return output_queue, workers, errors
+    
+    @staticmethod
+    def _stop_pipeline(stop_event: threading.Event, workers: list) -> None:
+        """
+        Signal the pipeline stages to stop and wait for them to exit.
+        
+        Joins without a timeout: the capture thread may still be inside
+        read_frame(), and the capture must not be released until it returns.
+        """
+        stop_event.set()
+        for worker in workers:
+            worker.join()
+    
+    @staticmethod
+    def _raise_pipeline_error(errors: list) -> None:
+        """Re-raise the first exception recorded by a pipeline stage, if any."""
+        if errors:
+            raise errors[0]
+    
     def run_webcam(self, camera_id: int = 0, save_output: bool = False) -> None:
         """
         Run face detection on webcam feed.
@@ -130,20 +383,24 @@ class FaceDetectionApp:
         
         screenshot_count = 0
         
+        # Capture and detection run on worker threads
+        stop_event = threading.Event()
+        results, workers, errors = self._start_pipeline(cap.read, stop_event)
+        
         try:
             while True:
-                ret, frame = cap.read()
+                result = self._queue_get(results, stop_event)
                 
-                if not ret:
-                    print("[ERROR] Failed to capture frame")
+                if result is None:
+                    if not errors:
+                        print("[ERROR] Failed to capture frame")
                     break
                 
-                # Detect faces and draw boxes
-                processed_frame, faces = self.detector.process_frame(frame)
+                frame, faces = result
                 
-                # Update and display FPS
+                # Update FPS and draw all overlays in one pass
                 fps = self._update_fps()
-                processed_frame = self.detector.draw_info(processed_frame, len(faces), fps)
+                processed_frame = draw_all(frame, faces, fps)
                 
                 # Display frame
                 cv2.imshow("Face Detection - Webcam (Press 'q' to quit)", processed_frame)
@@ -170,11 +427,14 @@ class FaceDetectionApp:
                     screenshot_count += 1
                     
         finally:
+            self._stop_pipeline(stop_event, workers)
             cap.release()
             if out is not None:
                 out.release()
             cv2.destroyAllWindows()
             print("[INFO] Webcam released")
+        
+        self._raise_pipeline_error(errors)
     
     def run_image(self, image_path: str, save_output: bool = False) -> None:
         """
@@ -209,7 +469,7 @@ class FaceDetectionApp:
         
         # Detect faces
         start_time = time.time()
-        processed_image, faces = self.detector.process_frame(image)
+        processed_image, faces = self.accel.process_frame(image, self.gpu_context)
         detection_time = time.time() - start_time
         
         # Print results
@@ -289,9 +549,18 @@ class FaceDetectionApp:
             os.makedirs(config.OUTPUT_DIR, exist_ok=True)
             filename = os.path.basename(video_path)
             name, _ = os.path.splitext(filename)
-            output_path = os.path.join(config.OUTPUT_DIR, f"{name}_detected.avi")
-            fourcc = cv2.VideoWriter_fourcc(*'XVID')
-            out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+            output_fps = fps if fps > 0 else 30.0
+            
+            # Prefer an ffmpeg (hardware) H.264 encoder, else OpenCV XVID
+            codec = FFmpegVideoWriter.select_codec()
+            if codec is not None:
+                output_path = os.path.join(config.OUTPUT_DIR, f"{name}_detected.mp4")
+                out = FFmpegVideoWriter(output_path, output_fps, (width, height), codec)
+                print(f"[INFO] Encoding with ffmpeg ({codec})")
+            else:
+                output_path = os.path.join(config.OUTPUT_DIR, f"{name}_detected.avi")
+                fourcc = cv2.VideoWriter_fourcc(*'XVID')
+                out = cv2.VideoWriter(output_path, fourcc, output_fps, (width, height))
             print(f"[INFO] Saving output to: {output_path}")
         
         # Calculate delay for real-time playback
@@ -301,52 +570,53 @@ class FaceDetectionApp:
         paused = False
         total_faces_detected = 0
         
+        # Decode on the GPU (NVDEC) when the CUDA backend is active,
+        # keeping frames in device memory until detection is done
+        gpu_reader = open_gpu_video(video_path) if self.accel.backend == "cuda" else None
+        if gpu_reader is not None:
+            print("[INFO] Using GPU video decoding")
+        read_frame = gpu_reader.nextFrame if gpu_reader is not None else cap.read
+        
+        # Capture and detection run on worker threads
+        stop_event = threading.Event()
+        results, workers, errors = self._start_pipeline(
+            read_frame, stop_event, gpu_frames=gpu_reader is not None
+        )
+        
         try:
             while True:
                 if not paused:
-                    ret, frame = cap.read()
+                    result = self._queue_get(results, stop_event)
                     
-                    if not ret:
-                        print("\n[INFO] Video ended")
+                    if result is None:
+                        if not errors:
+                            print("\n[INFO] Video ended")
                         break
                     
                     frame_count += 1
                     
-                    # Detect faces
-                    processed_frame, faces = self.detector.process_frame(frame)
+                    # Detected faces
+                    frame, faces = result
                     total_faces_detected += len(faces)
                     
                     # Update FPS
                     current_fps = self._update_fps()
                     
-                    # Draw info overlay
-                    processed_frame = self.detector.draw_info(
-                        processed_frame, len(faces), current_fps
-                    )
-                    
-                    # Draw progress bar
+                    # Draw boxes, info and progress bar in one pass
                     progress = frame_count / total_frames if total_frames > 0 else 0
-                    bar_width = int(width * 0.8)
-                    bar_start = int(width * 0.1)
-                    cv2.rectangle(
-                        processed_frame,
-                        (bar_start, height - 20),
-                        (bar_start + bar_width, height - 10),
-                        (100, 100, 100), -1
-                    )
-                    cv2.rectangle(
-                        processed_frame,
-                        (bar_start, height - 20),
-                        (bar_start + int(bar_width * progress), height - 10),
-                        (0, 255, 0), -1
-                    )
+                    processed_frame = draw_all(frame, faces, current_fps, progress)
                     
                     # Display frame
                     cv2.imshow("Face Detection - Video (Press 'q' to quit)", processed_frame)
                     
                     # Save frame if recording
                     if out is not None:
-                        out.write(processed_frame)
+                        try:
+                            out.write(processed_frame)
+                        except RuntimeError as e:
+                            print(f"[ERROR] {e}; recording stopped")
+                            out.release()
+                            out = None
                 
                 # Handle keyboard input
                 key = cv2.waitKey(delay) & 0xFF
@@ -359,6 +629,7 @@ class FaceDetectionApp:
                     print(f"[INFO] {'Paused' if paused else 'Resumed'}")
                     
         finally:
+            self._stop_pipeline(stop_event, workers)
             cap.release()
             if out is not None:
                 out.release()
@@ -370,6 +641,8 @@ class FaceDetectionApp:
             print(f"  Total detections: {total_faces_detected}")
             if frame_count > 0:
                 print(f"  Avg detections/frame: {total_faces_detected/frame_count:.2f}")
+        
+        self._raise_pipeline_error(errors)
 
 
 def main():
@@ -0,0 +1,16 @@
+#!/usr/bin/env sh
+# Start the web interface with one worker process per CPU core.
+# Override the worker count with WORKERS=N ./run.sh
+cd "$(dirname "$0")" || exit 1
+
+# Workers size their OpenCV and detection thread pools from this
+WEB_WORKERS="${WORKERS:-$(nproc)}"
+export WEB_WORKERS
+
+exec uvicorn app:app \
+    --host 0.0.0.0 \
+    --port 8000 \
+    --workers "$WEB_WORKERS" \
+    --loop uvloop \
+    --http httptools \
+    --ws websockets
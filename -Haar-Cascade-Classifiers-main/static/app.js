@@ -103,11 +103,13 @@ function initControls() {
     elements.scaleFactor.addEventListener('input', (e) => {
         state.settings.scaleFactor = parseFloat(e.target.value);
         elements.scaleFactorValue.textContent = state.settings.scaleFactor.toFixed(2);
+        sendDetectionParams();
     });
     
     elements.minNeighbors.addEventListener('input', (e) => {
         state.settings.minNeighbors = parseInt(e.target.value);
         elements.minNeighborsValue.textContent = state.settings.minNeighbors;
+        sendDetectionParams();
     });
 }
 
@@ -211,7 +213,10 @@ function connectWebSocket() {
     
     state.websocket = new WebSocket(wsUrl);
     
-    state.websocket.onopen = () => detectLoop();
+    state.websocket.onopen = () => {
+        sendDetectionParams();
+        detectLoop();
+    };
     
     state.websocket.onmessage = (event) => {
         try {
@@ -226,6 +231,15 @@ function connectWebSocket() {
     };
 }
 
+function sendDetectionParams() {
+    if (!state.websocket || state.websocket.readyState !== WebSocket.OPEN) return;
+    
+    state.websocket.send(JSON.stringify({
+        scale_factor: state.settings.scaleFactor,
+        min_neighbors: state.settings.minNeighbors
+    }));
+}
+
 function detectLoop() {
     if (!state.isDetecting) return;
     
@@ -248,17 +262,16 @@ function detectLoop() {
     const tempCtx = tempCanvas.getContext('2d');
     tempCtx.drawImage(elements.videoElement, 0, 0, width, height);
     
-    const frameData = tempCanvas.toDataURL('image/jpeg', 0.7);
-    
-    try {
-        state.websocket.send(JSON.stringify({
-            frame: frameData,
-            scale_factor: state.settings.scaleFactor,
-            min_neighbors: state.settings.minNeighbors
-        }));
-    } catch (e) {
-        console.error('Send error:', e);
-    }
+    // Send the frame as a binary JPEG message
+    tempCanvas.toBlob((blob) => {
+        if (!blob || !state.websocket || state.websocket.readyState !== WebSocket.OPEN) return;
+        
+        try {
+            state.websocket.send(blob);
+        } catch (e) {
+            console.error('Send error:', e);
+        }
+    }, 'image/jpeg', 0.7);
     
     // FPS counter
     state.stats.frameCount++;
@@ -385,15 +398,15 @@ async function processVideoFrames() {
     const tempCtx = tempCanvas.getContext('2d');
     tempCtx.drawImage(elements.videoElement, 0, 0);
     
-    const frameData = tempCanvas.toDataURL('image/jpeg', 0.8);
+    const frameBlob = await new Promise(resolve => tempCanvas.toBlob(resolve, 'image/jpeg', 0.8));
     
     try {
         const formData = new FormData();
-        formData.append('image_data', frameData);
+        formData.append('file', frameBlob, 'frame.jpg');
         formData.append('scale_factor', state.settings.scaleFactor);
         formData.append('min_neighbors', state.settings.minNeighbors);
         
-        const response = await fetch('/api/detect/base64', {
+        const response = await fetch('/api/rects', {
             method: 'POST',
             body: formData
         });